@@ -1,6 +1,13 @@
 import os
+import json
+import time
+import zlib
+import hashlib
 import subprocess
+import signal
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, as_completed
 from datetime import datetime, timedelta
 
 # Configuration
@@ -13,6 +20,17 @@ DATABASE = "metastore"
 USER = "hive"
 HOST = "10.11.229.10"  # Updated PostgreSQL server address
 
+# Verification settings
+VERIFY_SUMMARY_FILE = os.path.join(BACKUP_DIR, "verification_summary.json")
+VERIFY_WORKERS = os.cpu_count() or 2
+VERIFY_CHUNK_SIZE = 1024 * 1024
+VERIFY_LINE_KEEP = 4096  # Bytes kept from each end of an unfinished line; only prefixes/suffixes are checked
+VERIFY_TIMEOUT = 2 * 60 * 60  # Seconds for the whole verify stage; unfinished backups are marked failed
+RESTORE_TEST = False  # Restore each new backup into a throwaway local database
+RESTORE_HOST = "localhost"
+RESTORE_USER = "postgres"  # Needs CREATEDB; roles owning objects in the dump (e.g. hive) must exist
+RESTORE_TIMEOUT = 90 * 60  # Seconds allowed for a single restore
+
 # Setup logging
 logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format="%(asctime)s - %(message)s")
 
@@ -21,6 +39,138 @@ def log(message):
     print(message)
     logging.info(message)
 
+def restore_test(file_path):
+    """Restores a backup into a throwaway local database and returns the elapsed seconds."""
+    db_name = "verify_" + os.path.basename(file_path).split("_")[0]
+    conn = ["-h", RESTORE_HOST, "-U", RESTORE_USER]
+    env = os.environ.copy()
+    env["PGPASSFILE"] = PGPASSFILE
+
+    try:
+        for command in (["dropdb", *conn, "--if-exists", db_name], ["createdb", *conn, db_name]):
+            subprocess.run(command, check=True, env=env, capture_output=True, text=True, timeout=300)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"{e.cmd[0]} {db_name} failed: {e.stderr.strip()[-500:]}")
+    except subprocess.TimeoutExpired as e:
+        raise RuntimeError(f"{e.cmd[0]} {db_name} timed out after {e.timeout}s")
+    try:
+        start = time.monotonic()
+        gunzip = subprocess.Popen(["gzip", "-dc", file_path], stdout=subprocess.PIPE)
+        psql = subprocess.Popen(
+            ["psql", *conn, "-d", db_name, "-X", "-q", "-v", "ON_ERROR_STOP=1"],
+            stdin=gunzip.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, text=True,
+        )
+        gunzip.stdout.close()  # Let gzip see EPIPE if psql exits early
+        try:
+            _, psql_stderr = psql.communicate(timeout=RESTORE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            psql.kill()
+            gunzip.kill()
+            psql.communicate()
+            gunzip.wait()
+            raise RuntimeError(f"psql restore timed out after {RESTORE_TIMEOUT}s")
+        gunzip.wait()
+        # psql first: when ON_ERROR_STOP aborts it, gzip dies of SIGPIPE and psql's stderr holds the reason.
+        if psql.returncode != 0:
+            raise RuntimeError(f"psql restore failed: {psql_stderr.strip()[-500:]}")
+        if gunzip.returncode != 0:
+            raise RuntimeError(f"gzip -dc exited with {gunzip.returncode}")
+        return round(time.monotonic() - start, 1)
+    finally:
+        try:
+            subprocess.run(["dropdb", *conn, "--if-exists", db_name], env=env, capture_output=True, timeout=300)
+        except subprocess.TimeoutExpired:
+            pass
+
+def verification_failure(file, error):
+    """Builds a failed summary entry for a backup whose worker did not return a result."""
+    return {
+        "file": file,
+        "verified_at": datetime.now().isoformat(timespec="seconds"),
+        "status": "failed",
+        "error": error,
+    }
+
+def verify_backup(file_path):
+    """Streams a backup through decompression and checksum, sanity-checks the SQL and optionally restores it."""
+    result = {"file": os.path.basename(file_path), "verified_at": datetime.now().isoformat(timespec="seconds")}
+    try:
+        sha256 = hashlib.sha256()
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip container, CRC checked at end of stream
+        compressed_bytes = uncompressed_bytes = 0
+        header = footer = in_copy = False
+        tables = copy_blocks = 0
+        tail = b""
+
+        def decompressed_pieces(f):
+            """Yields decompressed data in pieces of at most VERIFY_CHUNK_SIZE bytes."""
+            nonlocal compressed_bytes
+            for chunk in iter(lambda: f.read(VERIFY_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+                compressed_bytes += len(chunk)
+                if decompressor.eof:
+                    raise ValueError("trailing data after end of gzip stream")
+                data = decompressor.decompress(chunk, VERIFY_CHUNK_SIZE)
+                while True:
+                    # Once the stream ends, leftover input moves to unused_data and is never consumed.
+                    if decompressor.eof and (decompressor.unused_data or decompressor.unconsumed_tail):
+                        raise ValueError("trailing data after end of gzip stream")
+                    yield data
+                    if not decompressor.unconsumed_tail or decompressor.eof:
+                        break
+                    data = decompressor.decompress(decompressor.unconsumed_tail, VERIFY_CHUNK_SIZE)
+
+        with open(file_path, "rb") as f:
+            for data in decompressed_pieces(f):
+                uncompressed_bytes += len(data)
+                lines = (tail + data).split(b"\n")
+                tail = lines.pop()
+                if len(tail) > 2 * VERIFY_LINE_KEEP:
+                    # Long lines (e.g. big COPY values) keep only their ends so scanning stays linear.
+                    tail = tail[:VERIFY_LINE_KEEP] + tail[-VERIFY_LINE_KEEP:]
+                for line in lines:
+                    if in_copy:
+                        # Data rows are not SQL; only the terminator matters.
+                        if line == b"\\.":
+                            in_copy = False
+                    elif line.startswith(b"COPY ") and line.endswith(b" FROM stdin;"):
+                        copy_blocks += 1
+                        in_copy = True
+                    elif line.startswith(b"CREATE TABLE "):
+                        tables += 1
+                    elif line.startswith(b"-- PostgreSQL database dump complete"):
+                        footer = True
+                    elif line.startswith(b"-- PostgreSQL database dump"):
+                        header = True
+
+        if not decompressor.eof:
+            raise ValueError("gzip stream is truncated")
+        if decompressor.unused_data:
+            raise ValueError("trailing data after end of gzip stream")
+        if not header:
+            raise ValueError("missing pg_dump header")
+        if not footer:
+            raise ValueError("missing pg_dump completion marker, dump is incomplete")
+        if in_copy:
+            raise ValueError("last COPY block has no terminator")
+        if tables == 0:
+            raise ValueError("dump contains no CREATE TABLE statements")
+
+        result.update(
+            sha256=sha256.hexdigest(),
+            compressed_bytes=compressed_bytes,
+            uncompressed_bytes=uncompressed_bytes,
+            tables=tables,
+            copy_blocks=copy_blocks,
+        )
+        if RESTORE_TEST:
+            result["restore_seconds"] = restore_test(file_path)
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    return result
+
 # Ensure backup directory exists
 if not os.path.isdir(BACKUP_DIR):
     log(f"ERROR: Backup directory {BACKUP_DIR} does not exist. Exiting.")
@@ -77,5 +227,67 @@ for file in os.listdir(BACKUP_DIR):
             except Exception as e:
                 log(f"❌ ERROR: Failed to delete {file_path}. {str(e)}")
 
+# Verify backups that have not been verified yet
+try:
+    with open(VERIFY_SUMMARY_FILE) as f:
+        summary = json.load(f)
+except FileNotFoundError:
+    summary = {}
+except Exception as e:
+    log(f"❌ ERROR: Unable to read {VERIFY_SUMMARY_FILE}, starting a new summary. {str(e)}")
+    summary = {}
+
+backups = sorted(file for file in os.listdir(BACKUP_DIR) if file.endswith(FILE_SUFFIX))
+summary = {file: entry for file, entry in summary.items() if file in backups}
+pending = [file for file in backups if summary.get(file, {}).get("status") != "ok"]
+
+log(f"🔍 Verifying {len(pending)} backup(s) with {min(VERIFY_WORKERS, max(len(pending), 1))} worker(s).")
+
+failed = []
+# Fork explicitly: this script runs at module level, so spawn/forkserver workers would re-run the backup.
+results = {}
+# Each worker leads its own process group so a timeout also stops its gzip/psql restore children.
+executor = ProcessPoolExecutor(
+    max_workers=VERIFY_WORKERS, mp_context=multiprocessing.get_context("fork"), initializer=os.setpgrp
+)
+futures = {executor.submit(verify_backup, os.path.join(BACKUP_DIR, file)): file for file in pending}
+try:
+    for future in as_completed(futures, timeout=VERIFY_TIMEOUT):
+        try:
+            results[futures[future]] = future.result()
+        except Exception as e:
+            # A worker died (e.g. OOM kill); record it so the summary is still written.
+            results[futures[future]] = verification_failure(futures[future], f"verification worker failed: {e!r}")
+except TimeoutError:
+    log(f"❌ ERROR: Verification did not finish within {VERIFY_TIMEOUT}s. Stopping workers.")
+    # Stuck workers would otherwise block shutdown and the interpreter's exit.
+    for process in list((executor._processes or {}).values()):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+executor.shutdown(wait=True, cancel_futures=True)
+
+for file in pending:
+    result = results.get(file) or verification_failure(file, f"verification did not finish within {VERIFY_TIMEOUT}s")
+    summary[file] = result
+    if result["status"] == "ok":
+        restore = f", restored in {result['restore_seconds']}s" if "restore_seconds" in result else ""
+        log(f"✅ Verified {result['file']}: {result['tables']} tables, sha256 {result['sha256'][:12]}{restore}")
+    else:
+        failed.append(result["file"])
+        log(f"❌ ERROR: Verification failed for {result['file']}. {result['error']}")
+
+try:
+    with open(VERIFY_SUMMARY_FILE, "w") as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+    log(f"📝 Verification summary written to {VERIFY_SUMMARY_FILE}")
+except Exception as e:
+    log(f"❌ ERROR: Failed to write {VERIFY_SUMMARY_FILE}. {str(e)}")
+
+if failed:
+    log(f"❌ ERROR: {len(failed)} backup(s) failed verification. Exiting.")
+    exit(1)
+
 log("🎉 Backup process completed successfully. See you tomorrow!")
 